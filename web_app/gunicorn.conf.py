@@ -0,0 +1,18 @@
+# Конфигурация gunicorn: gunicorn app:app (из папки web_app)
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Потоковые воркеры: обработчик /detect блокируется на ожидании пула процессов,
+# и пока он ждет, другие потоки принимают запросы
+worker_class = 'gthread'
+# Каждый воркер держит свой пул MediaPipe-процессов на cpu_count // workers ядер
+# (размер пула можно задать явно через POSE_WORKERS)
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+
+def post_worker_init(worker):
+    """Заранее запускает и прогревает пул MediaPipe-процессов воркера"""
+    from app import start_workers
+    start_workers()
@@ -0,0 +1,360 @@
+import cv2
+import mediapipe as mp
+import numpy as np
+import base64
+import logging
+
+# Трекер позы и функции для рабочих процессов пула. Вынесены из app.py, чтобы
+# процессы spawn импортировали только этот модуль, а не Flask-приложение
+logger = logging.getLogger(__name__)
+
+
+# Названия ключевых точек MediaPipe Pose (по индексу)
+_LANDMARK_NAMES = (
+    "Nose", "Left Eye Inner", "Left Eye", "Left Eye Outer",
+    "Right Eye Inner", "Right Eye", "Right Eye Outer",
+    "Left Ear", "Right Ear", "Mouth Left", "Mouth Right",
+    "Left Shoulder", "Right Shoulder", "Left Elbow",
+    "Right Elbow", "Left Wrist", "Right Wrist",
+    "Left Pinky", "Right Pinky", "Left Index",
+    "Right Index", "Left Thumb", "Right Thumb",
+    "Left Hip", "Right Hip", "Left Knee", "Right Knee",
+    "Left Ankle", "Right Ankle", "Left Heel",
+    "Right Heel", "Left Foot Index", "Right Foot Index",
+)
+
+
+class SimpleBodyTracker:
+    def __init__(self, model_complexity=0):
+        self.mp_pose = mp.solutions.pose
+        self.mp_drawing = mp.solutions.drawing_utils
+        # Соединения скелета считаем один раз, а не на каждый запрос
+        self._connections = tuple(sorted(self.mp_pose.POSE_CONNECTIONS))
+        # Шаблон заголовка аннотированного изображения и позиция чисел в нем
+        self._header_template = self._render_header_template()
+        self._header_value_x = 10 + max(
+            cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)[0][0]
+            for label in ("Landmarks: ", "Distances: ")
+        )
+
+        # Pose.process() не потокобезопасен: трекер рассчитан на один поток,
+        # параллелизм дает пул процессов (по трекеру на процесс).
+        # RGB-буфер переиспользуется между запросами
+        self.pose = self._create_pose(model_complexity)
+        self._rgb = None
+
+        # Качество JPEG для аннотированного изображения (по умолчанию в OpenCV 95)
+        self.jpeg_quality = 75
+        # Большие JPEG декодируем сразу с уменьшением (масштабирование IDCT в libjpeg):
+        # (минимальный размер файла в байтах, флаг cv2.imdecode, коэффициент уменьшения)
+        self.reduced_decode_steps = [
+            (4_000_000, cv2.IMREAD_REDUCED_COLOR_4, 4),
+            (1_000_000, cv2.IMREAD_REDUCED_COLOR_2, 2),
+        ]
+
+        # Важные пары точек для измерения (как в вашем коде)
+        pose_landmark = self.mp_pose.PoseLandmark
+        key_pairs = [
+            (pose_landmark.LEFT_SHOULDER, pose_landmark.RIGHT_SHOULDER, "Shoulders"),
+            (pose_landmark.LEFT_WRIST, pose_landmark.RIGHT_WRIST, "Hands"),
+            (pose_landmark.LEFT_HIP, pose_landmark.RIGHT_HIP, "Hips"),
+            (pose_landmark.LEFT_ANKLE, pose_landmark.RIGHT_ANKLE, "Feet"),
+            # Добавляем дополнительные расстояния
+            (pose_landmark.LEFT_SHOULDER, pose_landmark.LEFT_ELBOW, "Left Upper Arm"),
+            (pose_landmark.LEFT_ELBOW, pose_landmark.LEFT_WRIST, "Left Lower Arm"),
+            (pose_landmark.RIGHT_SHOULDER, pose_landmark.RIGHT_ELBOW, "Right Upper Arm"),
+            (pose_landmark.RIGHT_ELBOW, pose_landmark.RIGHT_WRIST, "Right Lower Arm"),
+        ]
+        # Индексы пар храним массивами, чтобы считать все расстояния одной операцией
+        self._pair_i = np.array([p1.value for p1, _, _ in key_pairs], dtype=np.int32)
+        self._pair_j = np.array([p2.value for _, p2, _ in key_pairs], dtype=np.int32)
+        self._pair_labels = [label for _, _, label in key_pairs]
+
+    def _render_header_template(self):
+        """Рисует статические подписи "Landmarks:" и "Distances:" один раз"""
+        template = np.zeros((70, 300, 3), dtype=np.uint8)
+        cv2.putText(template, "Landmarks:", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(template, "Distances:", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        return template
+
+    def _create_pose(self, model_complexity):
+        """Создает и прогревает экземпляр MediaPipe Pose"""
+        # model_complexity=0 — облегченная модель pose_landmark_lite (быстрее на CPU),
+        # 1 — полная модель pose_landmark_full
+        pose = self.mp_pose.Pose(
+            static_image_mode=True,  # Изменено на True для обработки изображений
+            model_complexity=model_complexity,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5
+        )
+
+        # Первый вызов process() инициализирует граф и делегаты TFLite —
+        # делаем это при старте, а не на первом запросе пользователя.
+        # На пустом кадре человек не находится, поэтому в static_image_mode
+        # прогревается только детектор: модель landmarks инициализируется
+        # на первом кадре с человеком
+        try:
+            pose.process(np.zeros((256, 256, 3), dtype=np.uint8))
+        except Exception as e:
+            logger.warning(f"Pose warm-up failed: {str(e)}")
+
+        return pose
+
+    def process_image(self, image_data, annotate=True):
+        """Обрабатывает одно изображение в base64 и возвращает результаты"""
+        try:
+            # Декодируем base64 изображение
+            if ',' in image_data:
+                image_data = image_data.split(',')[1]
+
+            image_bytes = base64.b64decode(image_data)
+        except Exception as e:
+            logger.error(f"Error decoding base64 image: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
+        response_data, annotated_jpeg = self.analyze_image(image_bytes, annotate)
+        if annotated_jpeg is not None:
+            response_data['annotated_image'] = self.jpeg_to_base64(annotated_jpeg)
+        return response_data
+
+    def process_image_binary(self, image_bytes, annotate=True):
+        """Обрабатывает сырые байты изображения, аннотированное изображение возвращает как JPEG-байты"""
+        return self.analyze_image(image_bytes, annotate)
+
+    def analyze_image(self, image_bytes, annotate=True):
+        """Определяет позу на закодированном изображении.
+
+        Возвращает словарь результатов и JPEG-байты аннотированного изображения
+        (или None, если поза не найдена или annotate=False).
+        """
+        try:
+            image_np, scale = self.decode_image(image_bytes)
+            if image_np is None:
+                return {'success': False, 'error': 'Could not decode image'}, None
+
+            # Обрабатываем позу
+            results = self.pose.process(self._to_rgb(image_np))
+
+            response_data = {
+                'success': True,
+                'landmarks_b64': None,
+                'landmark_indices': [],
+                'distances': [],
+                'annotated_image': None,
+                'connections': [],
+                # Во сколько раз аннотированное изображение меньше оригинала
+                # (координаты и расстояния всегда в пикселях оригинала)
+                'image_scale': scale,
+                'stats': {}
+            }
+            annotated_jpeg = None
+
+            if results.pose_landmarks:
+                landmarks = results.pose_landmarks.landmark
+
+                # Извлекаем landmarks в массив (N, 4): x, y, z, visibility
+                landmarks_np = np.fromiter(
+                    (v for l in landmarks for v in (l.x, l.y, l.z, l.visibility)),
+                    dtype='<f4', count=4 * len(landmarks)
+                ).reshape(-1, 4)
+                visible = landmarks_np[:, 3] > 0.3  # Более низкий порог для веб-версии
+                landmark_indices = np.nonzero(visible)[0].tolist()
+
+                # Вычисляем расстояния
+                distances_data = self.calculate_body_distances(landmarks_np, image_np.shape, scale)
+
+                # Создаем аннотированное изображение.
+                # Клиенту, который рисует точки сам, изображение не нужно
+                if annotate:
+                    annotated_image = self.create_annotated_image(image_np, results, distances_data,
+                                                                  len(landmark_indices), scale)
+                    annotated_jpeg = self.encode_jpeg(annotated_image)
+
+                # Видимые точки отдаем одним бинарным буфером float32 (little-endian)
+                response_data['landmarks_b64'] = base64.b64encode(landmarks_np[visible].tobytes()).decode('utf-8')
+                response_data['landmark_indices'] = landmark_indices
+                response_data['connections'] = self._connections
+                response_data['distances'] = distances_data
+
+                # Статистика
+                response_data['stats'] = {
+                    'total_landmarks': len(landmark_indices),
+                    'total_distances': len(distances_data),
+                    'detection_quality': self.calculate_detection_quality(landmarks_np[visible, 3])
+                }
+
+            return response_data, annotated_jpeg
+
+        except Exception as e:
+            logger.error(f"Error processing image: {str(e)}")
+            return {'success': False, 'error': str(e)}, None
+
+    def decode_image(self, image_bytes):
+        """Декодирует изображение в BGR, большие JPEG — сразу с уменьшением.
+
+        Возвращает изображение (или None) и коэффициент уменьшения относительно оригинала.
+        """
+        buffer = np.frombuffer(image_bytes, np.uint8)
+        # Размер файла говорит о разрешении только для JPEG: PNG того же размера
+        # может быть небольшим по разрешению, его не уменьшаем
+        if image_bytes[:3] == b'\xff\xd8\xff':
+            for min_size, flag, scale in self.reduced_decode_steps:
+                if len(image_bytes) > min_size:
+                    return cv2.imdecode(buffer, flag), scale
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR), 1
+
+    def _to_rgb(self, image):
+        """Конвертирует BGR в RGB (MediaPipe ожидает RGB) в переиспользуемый буфер.
+
+        Буфер пересоздается только при смене размера кадра, поэтому для потока кадров
+        с камеры новая память на каждый запрос не выделяется.
+        """
+        if self._rgb is None or self._rgb.shape != image.shape:
+            self._rgb = np.empty_like(image)
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        return self._rgb
+
+    def calculate_body_distances(self, landmarks, image_shape, scale=1):
+        """Вычисляет расстояния между ключевыми точками тела.
+
+        landmarks — массив (N, 4): x, y, z, visibility. image_shape — размер декодированного
+        (возможно уменьшенного в scale раз) изображения; координаты и расстояния
+        возвращаются в пикселях исходного разрешения.
+        """
+        h, w = image_shape[:2]
+        if len(landmarks) <= max(self._pair_i.max(), self._pair_j.max()):
+            return []
+
+        # Пиксельные координаты и расстояния для всех пар сразу
+        points = landmarks[:, :2] * np.array([w * scale, h * scale], dtype=np.float32)
+        delta = points[self._pair_i] - points[self._pair_j]
+        pair_distances = np.hypot(delta[:, 0], delta[:, 1])
+        visible = (landmarks[self._pair_i, 3] > 0.3) & (landmarks[self._pair_j, 3] > 0.3)
+        coords = points.astype(np.int32)
+
+        distances = []
+        for k in np.nonzero(visible)[0]:
+            point1, point2 = int(self._pair_i[k]), int(self._pair_j[k])
+            distances.append({
+                'label': self._pair_labels[k],
+                'distance': float(pair_distances[k]),
+                'point1': point1,
+                'point2': point2,
+                'point1_name': self.get_landmark_name(point1),
+                'point2_name': self.get_landmark_name(point2),
+                'coordinates': {
+                    'point1': {'x': int(coords[point1, 0]), 'y': int(coords[point1, 1])},
+                    'point2': {'x': int(coords[point2, 0]), 'y': int(coords[point2, 1])}
+                }
+            })
+
+        return distances
+
+    def create_annotated_image(self, image, results, distances, landmarks_count, scale=1):
+        """Создает изображение с landmarks и расстояниями.
+
+        Рисует прямо на переданном массиве (изменяет его на месте) и возвращает его же.
+        Координаты в distances — в пикселях оригинала, изображение уменьшено в scale раз.
+        """
+        # Рисуем landmarks тела (как в вашем коде)
+        if results.pose_landmarks:
+            self.mp_drawing.draw_landmarks(
+                image,
+                results.pose_landmarks,
+                self._connections
+            )
+
+        # Рисуем линии расстояний
+        for distance_info in distances:
+            coord1 = distance_info['coordinates']['point1']
+            coord2 = distance_info['coordinates']['point2']
+            x1, y1 = coord1['x'] // scale, coord1['y'] // scale
+            x2, y2 = coord2['x'] // scale, coord2['y'] // scale
+
+            # Рисуем линию
+            cv2.line(image, (x1, y1), (x2, y2), (255, 0, 255), 2)
+
+            # Подпись расстояния (в пикселях оригинала)
+            mid_x = (x1 + x2) // 2
+            mid_y = (y1 + y2) // 2
+
+            cv2.putText(image, f"{distance_info['distance']:.0f}px",
+                        (mid_x, mid_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+        # Общая информация: статические подписи накладываем готовым шаблоном,
+        # рисуем только числа
+        template_h = min(self._header_template.shape[0], image.shape[0])
+        template_w = min(self._header_template.shape[1], image.shape[1])
+        header = image[:template_h, :template_w]
+        np.bitwise_or(header, self._header_template[:template_h, :template_w], out=header)
+
+        cv2.putText(image, str(landmarks_count),
+                    (self._header_value_x, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(image, str(len(distances)),
+                    (self._header_value_x, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+        return image
+
+    def get_landmark_name(self, index):
+        """Возвращает название для каждой ключевой точки"""
+        return _LANDMARK_NAMES[index] if 0 <= index < len(_LANDMARK_NAMES) else f"Point_{index}"
+
+    def calculate_detection_quality(self, visibility):
+        """Рассчитывает качество обнаружения по массиву visibility видимых точек"""
+        if len(visibility) == 0:
+            return "poor"
+
+        visible_count = len(visibility)
+        high_confidence_count = int(np.count_nonzero(visibility > 0.7))
+
+        ratio = high_confidence_count / visible_count if visible_count > 0 else 0
+
+        if ratio > 0.8:
+            return "excellent"
+        elif ratio > 0.6:
+            return "good"
+        elif ratio > 0.4:
+            return "fair"
+        else:
+            return "poor"
+
+    def encode_jpeg(self, image):
+        """Кодирует изображение в JPEG и возвращает байты"""
+        try:
+            _, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            return buffer.tobytes()
+        except Exception as e:
+            logger.error(f"Error encoding image: {str(e)}")
+            return None
+
+    def jpeg_to_base64(self, jpeg_bytes):
+        """Конвертирует JPEG-байты в data URL base64"""
+        if jpeg_bytes is None:
+            return None
+        image_base64 = base64.b64encode(jpeg_bytes).decode('utf-8')
+        return f"data:image/jpeg;base64,{image_base64}"
+
+
+# Трекер создается отдельно в каждом рабочем процессе
+tracker = None
+
+
+def init_worker():
+    """Инициализирует трекер в рабочем процессе пула"""
+    global tracker
+    tracker = SimpleBodyTracker()
+
+
+def process_in_worker(image_data, annotate):
+    """Обрабатывает изображение трекером текущего рабочего процесса"""
+    return tracker.process_image(image_data, annotate)
+
+
+def process_binary_in_worker(image_bytes, annotate):
+    """Обрабатывает сырые байты изображения трекером текущего рабочего процесса"""
+    return tracker.process_image_binary(image_bytes, annotate)
+
+
+def warm_up_worker():
+    """Пустая задача: заставляет пул запустить рабочий процесс и создать в нем трекер"""
+    return None
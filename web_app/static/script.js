@@ -1,3 +1,17 @@
+// Названия ключевых точек MediaPipe Pose (по индексу)
+const LANDMARK_NAMES = [
+    'Nose', 'Left Eye Inner', 'Left Eye', 'Left Eye Outer',
+    'Right Eye Inner', 'Right Eye', 'Right Eye Outer',
+    'Left Ear', 'Right Ear', 'Mouth Left', 'Mouth Right',
+    'Left Shoulder', 'Right Shoulder', 'Left Elbow',
+    'Right Elbow', 'Left Wrist', 'Right Wrist',
+    'Left Pinky', 'Right Pinky', 'Left Index',
+    'Right Index', 'Left Thumb', 'Right Thumb',
+    'Left Hip', 'Right Hip', 'Left Knee', 'Right Knee',
+    'Left Ankle', 'Right Ankle', 'Left Heel',
+    'Right Heel', 'Left Foot Index', 'Right Foot Index'
+];
+
 class PoseDetectionApp {
     constructor() {
         this.video = document.getElementById('video');
@@ -18,6 +32,7 @@ class PoseDetectionApp {
 
         this.stream = null;
         this.isCameraOn = false;
+        this.annotatedImageUrl = null;
 
         this.initEventListeners();
         this.checkCameraSupport();
@@ -123,10 +138,10 @@ class PoseDetectionApp {
 
             // Захватываем кадр
             this.ctx.drawImage(this.video, 0, 0, this.canvas.width, this.canvas.height);
-            const imageData = this.canvas.toDataURL('image/jpeg', 0.8);
+            const imageBlob = await new Promise(resolve => this.canvas.toBlob(resolve, 'image/jpeg', 0.8));
 
             // Отправляем на сервер
-            const result = await this.sendToServer(imageData);
+            const result = await this.sendToServer(imageBlob);
             this.displayResults(result);
             this.updateStatus('✅ Поза определена успешно!', 'success');
 
@@ -147,37 +162,40 @@ class PoseDetectionApp {
             return;
         }
 
-        const reader = new FileReader();
-
-        reader.onload = async (e) => {
-            try {
-                this.updateStatus('🔍 Анализируем загруженное изображение...', 'loading');
-                const imageData = e.target.result;
-                const result = await this.sendToServer(imageData);
+        // Файл отправляется как есть, без чтения в base64
+        this.updateStatus('🔍 Анализируем загруженное изображение...', 'loading');
+        this.sendToServer(file)
+            .then(result => {
                 this.displayResults(result);
                 this.updateStatus('✅ Анализ завершен!', 'success');
-            } catch (error) {
+            })
+            .catch(error => {
                 this.updateStatus('❌ Ошибка анализа: ' + error.message, 'error');
-            }
-        };
-
-        reader.readAsDataURL(file);
+            });
     }
 
-    async sendToServer(imageData) {
-        const response = await fetch('/detect', {
+    async sendToServer(imageBlob) {
+        const formData = new FormData();
+        formData.append('image', imageBlob, imageBlob.name || 'frame.jpg');
+
+        const response = await fetch('/detect_binary', {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ image: imageData })
+            body: formData
         });
 
         if (!response.ok) {
             throw new Error(`Server error: ${response.status}`);
         }
 
-        const result = await response.json();
+        // Аннотированное изображение приходит бинарным JPEG, результаты — в заголовке X-Landmarks
+        let result;
+        const contentType = response.headers.get('Content-Type') || '';
+        if (contentType.startsWith('image/jpeg')) {
+            result = JSON.parse(response.headers.get('X-Landmarks'));
+            result.annotated_image = URL.createObjectURL(await response.blob());
+        } else {
+            result = await response.json();
+        }
 
         if (!result.success) {
             throw new Error(result.error || 'Detection failed');
@@ -199,18 +217,47 @@ class PoseDetectionApp {
         this.updateStatus('⏹️ Камера остановлена', 'loading');
     }
 
+    decodeLandmarks(result) {
+        // Сервер присылает видимые точки одним буфером float32: x, y, z, visibility
+        if (!result.landmarks_b64) return [];
+
+        const binary = atob(result.landmarks_b64);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        const view = new DataView(bytes.buffer);
+
+        return result.landmark_indices.map((index, i) => ({
+            index: index,
+            name: LANDMARK_NAMES[index] || `Point_${index}`,
+            x: view.getFloat32(i * 16, true),
+            y: view.getFloat32(i * 16 + 4, true),
+            z: view.getFloat32(i * 16 + 8, true),
+            visibility: view.getFloat32(i * 16 + 12, true)
+        }));
+    }
+
     displayResults(result) {
         this.resultsSection.style.display = 'block';
+        const landmarks = this.decodeLandmarks(result);
 
         // Статистика
         this.statsDiv.innerHTML = `
             <p>🎯 Тип позы: <strong>${this.getPoseTypeName(result.pose_type)}</strong></p>
-            <p>📍 Обнаружено точек: <strong>${result.landmarks.length}</strong></p>
+            <p>📍 Обнаружено точек: <strong>${landmarks.length}</strong></p>
             <p>🔗 Соединений: <strong>${result.connections ? result.connections.length : 0}</strong></p>
         `;
 
         // Аннотированное изображение
+        if (this.annotatedImageUrl) {
+            URL.revokeObjectURL(this.annotatedImageUrl);
+            this.annotatedImageUrl = null;
+        }
         if (result.annotated_image) {
+            if (result.annotated_image.startsWith('blob:')) {
+                this.annotatedImageUrl = result.annotated_image;
+            }
             this.annotatedImage.src = result.annotated_image;
             this.annotatedImage.style.display = 'block';
         } else {
@@ -218,8 +265,8 @@ class PoseDetectionApp {
         }
 
         // Список landmarks
-        if (result.landmarks && result.landmarks.length > 0) {
-            this.landmarksList.innerHTML = result.landmarks
+        if (landmarks.length > 0) {
+            this.landmarksList.innerHTML = landmarks
                 .map(landmark => `
                     <div class="landmark-item">
                         <div>Точка ${landmark.index}</div>